@@ -22,20 +22,137 @@ LCD_CHARACTER = 1 << 0
 
 LCD_RETURNHOME = 1 << 1
 
+LCD_SET_CGRAM = 1 << 6
 LCD_SET_DDRAM = 1 << 7
 
+# DDRAM address of the first column of each row
+_ROW_OFFSETS = (0x00, 0x40, 0x14, 0x54)
+
+
+def _ddram_address(row, col):
+    """
+    Return the DDRAM address the lcd is at after position [row,col].
+    col may be one past the last column of the row, the address then
+    wraps like the address counter of the lcd does (0x27 -> 0x40,
+    0x67 -> 0x00), as there are no addresses 0x28 - 0x3f and 0x68 - 0x7f.
+    """
+    address = _ROW_OFFSETS[row] + col
+    if 0x28 <= address < 0x40:
+        address += 0x40 - 0x28
+    elif address >= 0x68:
+        address -= 0x68
+
+    return address
+
+
+def _put_frames(buf, i, byte, mode):
+    """
+    Store the 6 bytes that send byte to lcd into buf, starting at index i.
+    Each nibble is sent as data, data with enable = 1,
+    data with enable = 0 (see LCD.__send_byte for the format).
+    """
+    first = mode | (byte & 0xf0) | 1 << 3
+    second = mode | ((byte << 4) & 0xf0) | 1 << 3
+
+    buf[i] = first
+    buf[i + 1] = first | LCD_ENABLE_BIT
+    buf[i + 2] = first
+    buf[i + 3] = second
+    buf[i + 4] = second | LCD_ENABLE_BIT
+    buf[i + 5] = second
+
+
+def _build_character_frames():
+    """Precompute the frames of every byte sent as a character."""
+    frames = bytearray(6 * 256)
+    for byte in range(256):
+        _put_frames(frames, 6 * byte, byte, LCD_CHARACTER)
+
+    return memoryview(bytes(frames))
+
+
+# frames of character b are at indices [6 * b, 6 * b + 6)
+_CHARACTER_FRAMES = _build_character_frames()
+
+
+def _put_characters(buf, i, data):
+    """
+    Store the frames of all bytes of data sent as characters into buf,
+    starting at index i. Returns the index after the last stored byte.
+    """
+    frames = _CHARACTER_FRAMES
+    for byte in data:
+        j = 6 * byte
+        buf[i:i + 6] = frames[j:j + 6]
+        i += 6
+
+    return i
+
+
+def _build_init_frames():
+    """
+    Precompute the frames of the initialisation sequence.
+    The lcd may still be in 8-bit mode, so each instruction
+    is a single nibble: 0x3 three times to reset the interface,
+    then 0x2 to switch it to 4-bit mode.
+    """
+    frames = bytearray(12)
+    i = 0
+    for nibble in (0x30, 0x30, 0x30, 0x20):
+        frames[i] = nibble | 1 << 3
+        frames[i + 1] = nibble | 1 << 3 | LCD_ENABLE_BIT
+        frames[i + 2] = nibble | 1 << 3
+        i += 3
+
+    return memoryview(bytes(frames))
+
+
+_INIT_FRAMES = _build_init_frames()
+
+
+def _encode(string):
+    """
+    Convert string to the character codes sent to the display,
+    the code of each character is the same as ord(character) & 0xff.
+    """
+    data = string.encode()
+    if len(data) != len(string):
+        # non-ASCII characters were encoded to several bytes (UTF-8)
+        data = bytes(ord(character) & 0xff for character in string)
+
+    return data
+
 
 class LCDException(Exception):
     pass
 
 
+class _Batch:
+    """
+    Context manager returned by LCD.batched,
+    calls begin on entering and end on leaving the with block.
+    """
+
+    def __init__(self, begin, end):
+        self.__begin = begin
+        self.__end = end
+
+    def __enter__(self):
+        self.__begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__end()
+
+
 class LCD:
     """
     Interface for the lcd display HD44780U operated over I2C.
     """
 
     def __init__(self, sda_pin, scl_pin,
-                 display_address=None, rows=4, cols=20, i2c_peripheral=1):
+                 display_address=None, rows=4, cols=20, i2c_peripheral=1,
+                 clear_on_init=True, freq=400000):
         """
         sda_pin, scl_pin: Pin objects for the I2C interface,
             ex. Pin(14), Pin(15)
@@ -44,8 +161,13 @@ class LCD:
         If not provided, it will be attempted to get
             the device address automatically.
         i2c_peripheral: id of the i2c peripheral, default = 1
+        clear_on_init: clear the display after initialisation, default = True
+            If False, only the cursor is returned home
+            and the display keeps its previous content.
+        freq: I2C clock frequency in Hz, default = 400000 (fast mode)
+            Use a lower frequency (ex. 100000) if the wiring is unreliable.
         """
-        self.__i2c = I2C(i2c_peripheral, sda=sda_pin, scl=scl_pin)
+        self.__i2c = I2C(i2c_peripheral, sda=sda_pin, scl=scl_pin, freq=freq)
         if display_address is None:
             devices = self.__i2c.scan()
             if len(devices) == 0:
@@ -55,23 +177,68 @@ class LCD:
         else:
             self.__display_address = display_address
 
+        # cached to avoid attribute lookups on every write
+        self.__writeto = self.__i2c.writeto
+        self.__sleep_us = time.sleep_us
+
         self.__rows = rows
         self.__cols = cols
-        self.__send_byte(0x03, LCD_COMMAND)
-        self.__send_byte(0x03, LCD_COMMAND)
-        self.__send_byte(0x03, LCD_COMMAND)
-        self.__send_byte(0x02, LCD_COMMAND)
+        # reusable buffer for the frames of one byte sent by __send_byte
+        self.__frame = bytearray(6)
+        # reusable buffer for longer writes, fits a whole line
+        # and a command (ex. setting the cursor) with room to spare
+        self.__tx_buf = bytearray(6 * cols + 12)
+        self.__tx_view = memoryview(self.__tx_buf)
+        # reusable buffer for a line assembled by write
+        self.__line_buf = bytearray(cols)
+        self.__line_view = memoryview(self.__line_buf)
+
+        # copy of the characters on the display, only characters
+        # that differ from it are sent, while the copy is known to be valid
+        self.__shadow = bytearray(b' ' * (rows * cols))
+        # a row of spaces, to reset the copy when the display is cleared
+        self.__blank_row = b' ' * cols
+        self.__shadow_valid = False
+        # position where the next character is written (row is None
+        # if unknown) and the DDRAM address the lcd is actually at
+        # (None if unknown), it may differ after unchanged characters
+        # were skipped
+        self.__cursor_row = None
+        self.__cursor_col = 0
+        self.__address = None
+
+        # the datasheet requires > 4.1 ms after the first instruction,
+        # > 100 us after the second one and ~37 us after the others
+        self.__writeto(self.__display_address, _INIT_FRAMES[0:3])
+        self.__sleep_us(5000)
+        self.__writeto(self.__display_address, _INIT_FRAMES[3:6])
+        self.__sleep_us(150)
+        self.__writeto(self.__display_address, _INIT_FRAMES[6:9])
+        self.__sleep_us(40)
+        self.__writeto(self.__display_address, _INIT_FRAMES[9:12])
+        self.__sleep_us(40)
         self.__send_byte(LCD_ENTRYMODESET | LCD_ENTRYLEFT, LCD_COMMAND)
 
         self.__display_on = True
         self.__blink_on = False
         self.__cursor_on = False
+        # display control updates are postponed inside batched() blocks,
+        # the depth counts the nested blocks
+        self.__batch_depth = 0
+        self.__control_pending = False
 
         self.__update_display_control()
 
-        self.__send_byte(LCD_CLEARDISPLAY, LCD_COMMAND)
+        if clear_on_init:
+            self.clear()
+        else:
+            self.return_home()
 
     def __update_display_control(self):
+        if self.__batch_depth > 0:
+            self.__control_pending = True
+            return
+
         display_control = LCD_DISPLAYCONTROL
 
         if self.__display_on:
@@ -85,72 +252,199 @@ class LCD:
 
         self.__send_byte(display_control, LCD_COMMAND)
 
-    def __write_i2c_byte(self, byte):
-        """ writes a single byte
-        byte: integer with range [0; 256),
-            will be converted to byte inside the function.
+        if self.__cursor_on or self.__blink_on:
+            self.__sync_cursor()
+
+    def __send_byte(self, byte, mode, post_delay_us=40):
+        """
+        Send byte of data to lcd.
+        r/w, rs, enable bits are set appropriately.
+        Both nibbles are sent in a single 6 byte I2C write,
+        each as data, data with enable = 1, data with enable = 0.
+        post_delay_us: time to wait for the lcd to execute the byte,
+            most instructions take ~37 us, clear and return home ~1.52 ms.
+
+        Final byte format is:
+        bit |   7   |   6   |   5   |   4   |     3     |  2     |  1  | 0
+        ----|-------|-------|-------|-------|-----------|--------|-----|----
+        val | D7/D3 | D6/D2 | D5/D1 | D4/D0 |     1     | enable | r/w | rs
         """
-        if type(byte) is not int:
-            raise LCDException("integer expected for writing to i2c")
 
-        if not (0 <= byte <= 255):
-            raise LCDException("byte for sending to i2c is out of bounds")
+        _put_frames(self.__frame, 0, byte, mode)
+        self.__writeto(self.__display_address, self.__frame)
 
-        self.__i2c.writeto(self.__display_address, bytes([byte]))
+        self.__sleep_us(post_delay_us)
 
-    def __toggle_enable(self, value):
+    def __send_bytes(self, data, mode):
         """
-        Wait, send the value again with enable bit on, wait,
-        then again with enable bit off, then wait.
+        Send several bytes of data to lcd in a single I2C write.
+        Data longer than the transmit buffer are split
+        into several writes.
+        data: bytes-like object, each byte is sent as two nibbles
+            in the same format as in __send_byte.
         """
-        time.sleep_us(600)
-        self.__write_i2c_byte(value | LCD_ENABLE_BIT)
-        time.sleep_us(600)
-        self.__write_i2c_byte(value & ~LCD_ENABLE_BIT)
-        time.sleep_us(600)
+        buf = self.__tx_buf
+        chunk = len(buf) // 6
+        data = memoryview(data)
+        for start in range(0, len(data), chunk):
+            part = data[start:start + chunk]
+            if mode == LCD_CHARACTER:
+                end = _put_characters(buf, 0, part)
+            else:
+                end = 0
+                for byte in part:
+                    _put_frames(buf, end, byte, mode)
+                    end += 6
 
-    def __send_byte(self, byte, mode):
+            self.__writeto(self.__display_address, self.__tx_view[:end])
+            self.__sleep_us(40)
+
+    def __move_and_write(self, row, col, data):
         """
-        Send byte of data to lcd.
-        r/w, rs, enable bits are set appropriately
+        Set cursor to position [row,col] and write data
+        (bytes-like object of character codes) from there.
+        """
+        command = self.__cursor_command(row, col)
+        if row < self.__rows and col + len(data) <= self.__cols:
+            self.__write_region(row, col, data)
+        else:
+            # data do not fit into the row, the position of the rest
+            # depends on the DDRAM layout, so stop tracking the display
+            self.__send_command_and_data(command, data)
+            self.__forget_display()
 
-        Final byte format is:
-        bit |   7   |   6   |   5   |   4   |     3     |  2     |  1  | 0
-        ----|-------|-------|-------|-------|-----------|--------|-----|----
-        val | D7/D3 | D6/D2 | D5/D1 | D4/D0 |     1     | enable | r/w | rs
+    def __write_at_cursor(self, data):
+        """
+        Write data (bytes-like object of character codes)
+        from the current cursor position.
         """
+        row = self.__cursor_row
+        if row is not None and row < self.__rows and \
+           self.__cursor_col + len(data) <= self.__cols:
+            self.__write_region(row, self.__cursor_col, data)
+        else:
+            self.__sync_cursor()
+            self.__send_bytes(data, LCD_CHARACTER)
+            self.__forget_display()
 
-        first = mode | (byte & 0xf0) | 1 << 3
-        second = mode | ((byte << 4) & 0xf0) | 1 << 3
+    def __write_region(self, row, col, data):
+        """
+        Write data (bytes-like object of character codes) from position
+        [row,col], data must fit into the row.
+        Only runs of characters that differ from the shadow copy
+        of the display are sent (see __send_at).
+        """
+        data = memoryview(data)
+        length = len(data)
+        shadow = self.__shadow
+        start = row * self.__cols + col
+
+        if not self.__shadow_valid:
+            if length > 0:
+                self.__send_at(row, col, data)
+        else:
+            i = 0
+            while i < length:
+                if data[i] == shadow[start + i]:
+                    i += 1
+                    continue
+
+                # find the end of the run of changed characters,
+                # a single unchanged character is cheaper to send again
+                # than a new command setting the cursor
+                end = i + 1
+                while end < length and (
+                        data[end] != shadow[start + end] or
+                        (end + 1 < length and
+                         data[end + 1] != shadow[start + end + 1])):
+                    end += 1
+
+                self.__send_at(row, col + i, data[i:end])
+                i = end
+
+        shadow[start:start + length] = data
+        self.__cursor_row = row
+        self.__cursor_col = col + length
+
+        if self.__cursor_on or self.__blink_on:
+            self.__sync_cursor()
+
+    def __send_at(self, row, col, data):
+        """
+        Send data (sent as characters) to position [row,col], preceded
+        by the command setting the cursor in one I2C write,
+        unless the lcd is already at that position.
+        """
+        if self.__address == _ddram_address(row, col):
+            self.__send_bytes(data, LCD_CHARACTER)
+        else:
+            self.__send_command_and_data(
+                self.__cursor_command(row, col), data)
 
-        for byte in [first, second]:
-            # set the data
-            self.__write_i2c_byte(byte)
-            # set enable = 1, enable = 0 to sample the data
-            self.__toggle_enable(byte)
+        self.__address = _ddram_address(row, col + len(data))
 
-    def set_cursor(self, row, col):
-        """Set cursor to position [row,col]."""
-        row_offsets = [0x00, 0x40, 0x14, 0x54]
+    def __sync_cursor(self):
+        """
+        Move the lcd to the tracked cursor position,
+        if it is known and the lcd is elsewhere.
+        """
+        if self.__cursor_row is None:
+            return
+
+        address = _ddram_address(self.__cursor_row, self.__cursor_col)
+        if self.__address != address:
+            self.__send_byte(LCD_SET_DDRAM | address, LCD_COMMAND)
+            self.__address = address
+
+    def __forget_display(self):
+        """
+        Stop tracking the cursor position and the display content
+        (until the display is cleared).
+        """
+        self.__shadow_valid = False
+        self.__cursor_row = None
+        self.__address = None
+
+    def __send_command_and_data(self, command, data):
+        """
+        Send command followed by data (sent as characters),
+        in a single I2C write if they fit into the transmit buffer.
+        """
+        data = memoryview(data)
+        # characters fitting into the buffer after the command
+        count = min(len(data), len(self.__tx_buf) // 6 - 1)
+
+        _put_frames(self.__tx_buf, 0, command, LCD_COMMAND)
+        end = _put_characters(self.__tx_buf, 6, data[:count])
 
-        if row not in range(len(row_offsets)):
+        self.__writeto(self.__display_address, self.__tx_view[:end])
+        self.__sleep_us(40)
+        # the rest of data too long for the buffer
+        self.__send_bytes(data[count:], LCD_CHARACTER)
+
+    def __cursor_command(self, row, col):
+        """Return the command setting cursor to position [row,col]."""
+        if not (0 <= row < 4):
             raise LCDException('invalid row for cursor: ' + str(row))
 
         if not (0 <= col < self.__cols):
             raise LCDException('invalid column for cursor: ' + str(col))
 
-        value = (LCD_SET_DDRAM | col) + row_offsets[row]
-        self.__send_byte(value, LCD_COMMAND)
+        return (LCD_SET_DDRAM | col) + _ROW_OFFSETS[row]
+
+    def set_cursor(self, row, col):
+        """Set cursor to position [row,col]."""
+        self.__send_byte(self.__cursor_command(row, col), LCD_COMMAND)
+        self.__cursor_row = row
+        self.__cursor_col = col
+        self.__address = _ddram_address(row, col)
 
     def write_character(self, character):
         """Send a single character to the display."""
-        if type(character) is not str:
-            raise LCDException("a character (str) is expected")
-
-        if not len(character) == 1:
+        if len(character) != 1:
             raise LCDException("a single character is expected, got a string")
 
-        self.__send_byte(ord(character), LCD_CHARACTER)
+        self.__write_at_cursor(_encode(character))
 
     def write(self, string, row=0) -> int:
         """
@@ -160,30 +454,54 @@ class LCD:
         Returns the next row that is free for writing.
         """
 
-        if type(string) is not str:
-            raise LCDException('string is expected for displaying')
-
-        words = string.split()
-        words_idx = 0
+        data = memoryview(_encode(string))
+        data_length = len(data)
+        line = self.__line_buf
+        cols = self.__cols
+        # index of the first character in data not written yet
+        pos = 0
         while row < self.__rows:
-            current_line = ''
-
-            while (words_idx < len(words)) and \
-                  (len(current_line) + len(words[words_idx]) <= self.__cols):
-                current_line += words[words_idx]
-                words_idx += 1
-                current_line += ' '
-
-            self.set_cursor(row, 0)
-            if len(current_line) > 0:
-                self.write_string(current_line.rstrip())
-            elif words_idx < len(words):
-                # word can never fit on a line, so split it at the end
-                self.write_string(words[words_idx][:self.__cols])
-                words[words_idx] = words[words_idx][self.__cols:]
-            else:
+            # number of characters in line
+            length = 0
+
+            while True:
+                # skip whitespace (space, \t, \n, \v, \f, \r)
+                while pos < data_length and \
+                        (data[pos] == 0x20 or 0x09 <= data[pos] <= 0x0d):
+                    pos += 1
+
+                if pos == data_length:
+                    break
+
+                end = pos + 1
+                while end < data_length and \
+                        not (data[end] == 0x20 or 0x09 <= data[end] <= 0x0d):
+                    end += 1
+
+                word_length = end - pos
+                if length == 0 and word_length > cols:
+                    # word can never fit on a line, so split it at the end
+                    line[0:cols] = data[pos:pos + cols]
+                    length = cols
+                    pos += cols
+                    break
+
+                if length + word_length + (1 if length else 0) > cols:
+                    break
+
+                if length > 0:
+                    line[length] = 0x20
+                    length += 1
+
+                line[length:length + word_length] = data[pos:end]
+                length += word_length
+                pos = end
+
+            if length == 0:
+                self.set_cursor(row, 0)
                 return row
 
+            self.__move_and_write(row, 0, self.__line_view[:length])
             row += 1
 
         return row
@@ -193,54 +511,86 @@ class LCD:
         Write string to the display
         (from current position, and without text wrapping).
         """
-        if type(string) is not str:
-            raise LCDException("string expected for writing to display")
-
-        for character in string:
-            self.write_character(character)
+        self.__write_at_cursor(_encode(string))
 
     def write_center(self, string, row):
         """Write string at center of given row."""
 
-        if type(string) is not str:
-            raise LCDException('expected string to write')
-
         if not (0 <= row < self.__rows):
             raise LCDException('invalid row for writing to display')
 
         length = len(string)
-        self.set_cursor(row, (self.__cols - length) // 2)
-        self.write_string(string)
+        self.__move_and_write(
+            row, (self.__cols - length) // 2, _encode(string))
 
     def write_left(self, string, row):
         """Write text at given row, start at column 0."""
-        if type(string) is not str:
-            raise LCDException('expected string to write')
-
         if not (0 <= row < self.__rows):
             raise LCDException('invalid row for writing to display')
 
-        self.set_cursor(row, 0)
-        self.write_string(string)
+        self.__move_and_write(row, 0, _encode(string))
 
     def write_right(self, string, row):
         """Write text at given row, align to right."""
-        if type(string) is not str:
-            raise LCDException('expected string to write')
-
         if not (0 <= row < self.__rows):
             raise LCDException('invalid row for writing to display')
 
-        self.set_cursor(row, self.__cols - len(string))
-        self.write_string(string)
+        self.__move_and_write(
+            row, self.__cols - len(string), _encode(string))
+
+    def write_buffer(self, data, row=0, col=0):
+        """
+        Write raw character codes to the display from position [row,col].
+        data: bytes-like object, ex. codes of custom characters
+            (0 - 7) loaded by load_cgram.
+        Nothing is trimmed or wrapped, keeping data within the row
+        is up to the caller.
+        """
+        self.__move_and_write(row, col, data)
+
+    def load_cgram(self, slot, pattern):
+        """
+        Define a custom character, which is then displayed
+        by character code slot.
+        slot: custom character number, 0 - 7
+        pattern: 8 bytes, one per row of the character from the top,
+            the lower 5 bits of each are the pixels.
+        """
+        if not (0 <= slot < 8):
+            raise LCDException('invalid CGRAM slot: ' + str(slot))
+
+        if len(pattern) != 8:
+            raise LCDException('a pattern of 8 bytes is expected')
+
+        self.__send_command_and_data(LCD_SET_CGRAM | slot << 3, pattern)
+
+        # the lcd now points into CGRAM, move it back to DDRAM,
+        # to the beginning if the cursor position is not known
+        self.__address = None
+        if self.__cursor_row is None:
+            self.__cursor_row = 0
+            self.__cursor_col = 0
+
+        self.__sync_cursor()
 
     def clear(self):
         """clear the display"""
-        self.__send_byte(LCD_CLEARDISPLAY, LCD_COMMAND)
+        self.__send_byte(LCD_CLEARDISPLAY, LCD_COMMAND, 1600)
+        shadow = self.__shadow
+        cols = self.__cols
+        for start in range(0, len(shadow), cols):
+            shadow[start:start + cols] = self.__blank_row
+        self.__shadow_valid = True
+        self.__cursor_row = 0
+        self.__cursor_col = 0
+        self.__address = 0
 
     def return_home(self):
         """Set cursor position to beginning."""
-        self.__send_byte(LCD_RETURNHOME, LCD_COMMAND)
+        self.__send_byte(LCD_RETURNHOME, LCD_COMMAND, 1600)
+        self.__cursor_row = 0
+        self.__cursor_col = 0
+        self.__address = 0
 
     def display_on(self, value=True):
         """Set the display on / off."""
@@ -273,3 +623,42 @@ class LCD:
     def blink_off(self):
         """Set the blink off."""
         self.blink_on(False)
+
+    def set_state(self, *, display=None, blink=None, cursor=None):
+        """
+        Set display, blink and cursor on / off at once,
+        arguments left as None are not changed.
+        Blinking on turns cursor on as well, unless cursor is given.
+        """
+        if display is not None:
+            self.__display_on = display
+
+        if blink is not None:
+            self.__blink_on = blink
+            if self.__blink_on:
+                self.__cursor_on = True
+
+        if cursor is not None:
+            self.__cursor_on = cursor
+
+        self.__update_display_control()
+
+    def batched(self):
+        """
+        Postpone display, blink and cursor changes until the end
+        of a with block, then send them to the display at once, ex.
+            with display.batched():
+                display.blink_on()
+                display.cursor_off()
+        Blocks can be nested, changes are sent when the outermost ends.
+        """
+        return _Batch(self.__begin_batch, self.__end_batch)
+
+    def __begin_batch(self):
+        self.__batch_depth += 1
+
+    def __end_batch(self):
+        self.__batch_depth -= 1
+        if self.__batch_depth == 0 and self.__control_pending:
+            self.__control_pending = False
+            self.__update_display_control()